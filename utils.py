@@ -1,24 +1,107 @@
-import json
 from os import path
+from string import Formatter
+from sys import intern
+from typing import Callable, List, Set, Union
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+_DEFAULT_TEMPLATES_PATH = path.join(path.dirname(path.realpath(__file__)), "prompt_templates.json")
+
+
+def _maybe_strip(s: str) -> str:
+    """
+    Strip only when the string actually has surrounding whitespace,
+    skipping the full scan strip() does on already-clean input.
+    """
+    if s[:1].isspace() or s[-1:].isspace():
+        return s.strip()
+    return s
+
+
+def _template_fields(template: str) -> Set[str]:
+    """
+    Return the set of replacement field names a template uses.
+    """
+    return {field for _, field, _, _ in Formatter().parse(template) if field}
+
+
+def _make_formatter(template: str) -> Callable[..., str]:
+    """
+    Compile a str.format-style template into a closure.
+
+    str.format reparses the template on every call; splitting it into
+    literal/field parts once lets every render skip that parsing.
+    """
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if spec or conversion:
+            # Format specs are not pre-split, let str.format handle them.
+            return template.format
+        parts.append((literal, field))
+    if len(parts) == 1 and parts[0][1] is None:
+        literal = parts[0][0]
+        return lambda **kwargs: literal
+
+    def formatter(**kwargs: str) -> str:
+        out = []
+        for literal, field in parts:
+            if literal:
+                out.append(literal)
+            if field is not None:
+                out.append(kwargs[field])
+        return "".join(out)
+
+    return formatter
 
 class PromptGenerator:
-    def __init__(self, model_name: str, config_location: str = ''):
+    __slots__ = (
+        "model_name",
+        "_config_file_path",
+        "model_templates",
+        "conversation",
+        "system_text",
+        "_joined_cache",
+        "model_prompt_helper",
+        "user_prompt_helper",
+        "system_prompt_helper",
+        "input_prompt_helper",
+        "template_name",
+        "is_llama_2",
+        "_fmt_system",
+        "_fmt_user",
+        "_fmt_model",
+        "_fmt_input",
+        "_fmt_one_shot",
+        "_fmt_one_shot_input",
+        "_role_dispatch",
+    )
+
+    # Parsed template files shared between instances, keyed by file path.
+    # Each entry is (mtime, templates) so an edited file is re-read.
+    _template_cache = {}
+
+    def __init__(self, model_name: str, config_location: str = '') -> None:
         """
         Initialize the PromptGenerator with the specified model_name.
         """
         self.model_name = model_name
-        
-        if config_location:
-            config_file_path = config_location
-        else:
-            config_file_path = path.join(path.dirname(path.realpath(__file__)), "", "prompt_templates.json")
-        with open(config_file_path, 'r') as f:
-            self.model_templates = json.load(f)
+
+        self._config_file_path = config_location or _DEFAULT_TEMPLATES_PATH
+        # Loaded lazily on the first load_template call, so instances that
+        # only use custom_template never pay for reading the file.
+        self.model_templates = None
 
         self.conversation = []
         self.system_text = ""
+        self.template_name = ""
+        self.is_llama_2 = False
+        # Joined conversation string, invalidated whenever the history changes.
+        self._joined_cache = None
 
-    def __len__(self):
+    def __len__(self) -> int:
         """
         length of the conversation items.
 
@@ -30,7 +113,21 @@ class PromptGenerator:
         """
         return len(self.conversation)
 
-    def load_template(self, template: str):
+    def _load_model_templates(self) -> None:
+        """
+        Read and parse the template file, going through the class cache.
+        """
+        config_file_path = self._config_file_path
+        mtime = path.getmtime(config_file_path)
+        cached = PromptGenerator._template_cache.get(config_file_path)
+        if cached is not None and cached[0] == mtime:
+            self.model_templates = cached[1]
+        else:
+            with open(config_file_path, 'rb') as f:
+                self.model_templates = _json.loads(f.read())
+            PromptGenerator._template_cache[config_file_path] = (mtime, self.model_templates)
+
+    def load_template(self, template: str) -> None:
         """
         Load a predefined template for the conversation based on the provided template_name.
 
@@ -40,23 +137,28 @@ class PromptGenerator:
         Raises:
             ValueError: If the specified template_name is not found.
         """
+        if self.model_templates is None:
+            self._load_model_templates()
         template = template.lower()
         if template in self.model_templates:
-            self.model_prompt_helper = self.model_templates[template]['response']
-            self.user_prompt_helper = self.model_templates[template]['user']
-            self.system_prompt_helper = self.model_templates[template]['system']
-            self.input_prompt_helper = self.model_templates[template]['input']
-            self.template_name = template
+            # Interned: these strings are compared and dict-keyed on every
+            # turn, interning makes those pointer comparisons.
+            self.model_prompt_helper = intern(self.model_templates[template]['response'])
+            self.user_prompt_helper = intern(self.model_templates[template]['user'])
+            self.system_prompt_helper = intern(self.model_templates[template]['system'])
+            self.input_prompt_helper = intern(self.model_templates[template]['input'])
+            self.template_name = intern(template)
             if self.template_name == "llama-2-chat":
                 self.is_llama_2 = True
             else:
                 self.is_llama_2 = False
+            self._compile_formatters()
         else:
             raise ValueError("Template not found.")
 
     def custom_template(
         self, system_template: str, response_template: str, user_template: str, input_template: str = ''
-    ):
+    ) -> None:
         """
         Create a custom template for the conversation.
 
@@ -78,8 +180,45 @@ class PromptGenerator:
         self.user_prompt_helper = user_template
         self.system_prompt_helper = system_template
         self.input_prompt_helper = input_template
+        self._compile_formatters()
 
-    def set_system_prompt(self, system_text: str):
+    def _compile_formatters(self) -> None:
+        """
+        Precompile the current template helpers so the format strings are
+        parsed once per template instead of once per conversation turn.
+        """
+        self._fmt_system = _make_formatter(self.system_prompt_helper)
+        self._fmt_user = _make_formatter(self.user_prompt_helper)
+        self._fmt_model = _make_formatter(self.model_prompt_helper)
+        self._fmt_input = _make_formatter(self.input_prompt_helper)
+        # One-shot prompts concatenate system + user/input output, so
+        # compile the concatenated templates to render them in one pass.
+        self._fmt_one_shot = _make_formatter(self.system_prompt_helper + self.user_prompt_helper)
+        self._fmt_one_shot_input = _make_formatter(self.system_prompt_helper + self.input_prompt_helper)
+        # Pick the user/model handlers for this template up front so
+        # add_to_conversation never re-checks the template per turn.
+        if self.template_name == "openai":
+            add_user = self._add_user_openai
+            add_model = self._add_model_openai
+        elif self.is_llama_2:
+            add_user = self._add_user_llama2
+            add_model = self._add_model_generic
+        elif self.template_name == "alpaca":
+            add_user = self._add_user_alpaca
+            add_model = self._add_model_generic
+        elif "input" in _template_fields(self.user_prompt_helper):
+            add_user = self._add_user_generic_input
+            add_model = self._add_model_generic
+        else:
+            add_user = self._add_user_generic
+            add_model = self._add_model_generic
+        self._role_dispatch = {
+            "system": self._add_system,
+            "user": add_user,
+            "model": add_model,
+        }
+
+    def set_system_prompt(self, system_text: str) -> None:
         """
         Set the system prompt text in the conversation.
 
@@ -87,17 +226,18 @@ class PromptGenerator:
             system_text (str): The text of the system prompt.
         """
         self.conversation = []
-        self.system_text = system_text
+        self._joined_cache = None
+        self.system_text = _maybe_strip(system_text)
         if self.template_name == "openai":
             self.conversation.append(
-                {"role": f"{self.system_prompt_helper}", "content": self.system_text}
+                (self.system_prompt_helper, self.system_text)
             )
         else:
             self.conversation.append(
-                self.system_prompt_helper.format(system=self.system_text.strip())
+                self._fmt_system(system=self.system_text)
             )
 
-    def add_to_conversation(self, role: str, text: str, preprompt: str = "", input: str = ""):
+    def add_to_conversation(self, role: str, text: str, preprompt: str = "", input: str = "") -> None:
         """
         Add a prompt to the conversation based on the role.
 
@@ -110,45 +250,77 @@ class PromptGenerator:
         Raises:
             ValueError: If the role is not one of 'system', 'user', or 'model'.
         """
+        role = role.lower()
         if role != 'user' and input:
             raise ValueError("Input parameter can only be used with user role")
-        
-        if role.lower() == "system":
-            self.set_system_prompt(preprompt.strip() + text.strip())
-            
-        elif role.lower() == "user":
-            if len(self.conversation) == 1 and self.is_llama_2:
-                self.conversation.append(self.user_prompt_helper.format(prompt=preprompt.strip() + text.strip()).replace(' [INST]',''))
-            elif self.template_name == "openai":
-                self.conversation.append(
-                    {
-                        "role": f"{self.user_prompt_helper}",
-                        "content": preprompt.strip() + text.strip(),
-                    }
-                )
-            elif input and self.template_name == "alpaca":
-                self.conversation.append(self.input_prompt_helper.format(prompt=preprompt.strip() + text.strip()))
-            else:
-                self.conversation.append(self.user_prompt_helper.format(prompt=preprompt.strip() + text.strip(), input = input.strip()))
-
-        elif role.lower() == "model":
-            if self.template_name == "openai":
-                self.conversation.append(
-                    {
-                        "role": f"{self.model_prompt_helper}",
-                        "content": preprompt.strip() + text.strip(),
-                    }
-                )
-            else:
-                self.conversation.append(self.model_prompt_helper.format(response=preprompt.strip() + text.strip()))
 
-    def clear_conversation(self):
+        handler = self._role_dispatch.get(role)
+        if handler is not None:
+            handler(text, preprompt, input)
+
+    def add_many(self, turns: List[tuple]) -> None:
+        """
+        Add several prompts to the conversation in one call.
+
+        Args:
+            turns (list): A list of (role, text) pairs, with the same roles
+                accepted by add_to_conversation.
+        """
+        get_handler = self._role_dispatch.get
+        for role, text in turns:
+            handler = get_handler(role.lower())
+            if handler is not None:
+                handler(text, "", "")
+
+    def _add_system(self, text: str, preprompt: str, input: str) -> None:
+        self.set_system_prompt(_maybe_strip(preprompt) + _maybe_strip(text))
+
+    def _add_user_openai(self, text: str, preprompt: str, input: str) -> None:
+        self._joined_cache = None
+        self.conversation.append(
+            (self.user_prompt_helper, _maybe_strip(preprompt) + _maybe_strip(text))
+        )
+
+    def _add_user_llama2(self, text: str, preprompt: str, input: str) -> None:
+        self._joined_cache = None
+        if len(self.conversation) == 1:
+            self.conversation.append(self._fmt_user(prompt=_maybe_strip(preprompt) + _maybe_strip(text)).replace(' [INST]',''))
+        else:
+            self.conversation.append(self._fmt_user(prompt=_maybe_strip(preprompt) + _maybe_strip(text)))
+
+    def _add_user_alpaca(self, text: str, preprompt: str, input: str) -> None:
+        self._joined_cache = None
+        if input:
+            self.conversation.append(self._fmt_input(prompt=_maybe_strip(preprompt) + _maybe_strip(text)))
+        else:
+            self.conversation.append(self._fmt_user(prompt=_maybe_strip(preprompt) + _maybe_strip(text)))
+
+    def _add_user_generic(self, text: str, preprompt: str, input: str) -> None:
+        self._joined_cache = None
+        self.conversation.append(self._fmt_user(prompt=_maybe_strip(preprompt) + _maybe_strip(text)))
+
+    def _add_user_generic_input(self, text: str, preprompt: str, input: str) -> None:
+        self._joined_cache = None
+        self.conversation.append(self._fmt_user(prompt=_maybe_strip(preprompt) + _maybe_strip(text), input = _maybe_strip(input)))
+
+    def _add_model_openai(self, text: str, preprompt: str, input: str) -> None:
+        self._joined_cache = None
+        self.conversation.append(
+            (self.model_prompt_helper, _maybe_strip(preprompt) + _maybe_strip(text))
+        )
+
+    def _add_model_generic(self, text: str, preprompt: str, input: str) -> None:
+        self._joined_cache = None
+        self.conversation.append(self._fmt_model(response=_maybe_strip(preprompt) + _maybe_strip(text)))
+
+    def clear_conversation(self) -> None:
         """
         Clear the conversation history.
         """
-        self.conversation = self.conversation[:1]
+        del self.conversation[1:]
+        self._joined_cache = None
 
-    def reduce_length(self, conv: int = 4):
+    def reduce_length(self, conv: int = 4) -> None:
         """
         reduce the conversation history, it reduce the conversation size to the system prompt and the last n conversations.
         Args:
@@ -158,11 +330,12 @@ class PromptGenerator:
         couple = conv * 2 - 1
         if len(self.conversation) < couple:
             couple = len(self.conversation) - 1
-        self.conversation = self.conversation[:1] + self.conversation[-couple:]
+        del self.conversation[1:len(self.conversation) - couple]
+        self._joined_cache = None
 
     def generate_one_shot_prompt(
         self, user_prompt: str, preprompt: str = "", system_prompt: str = "", input: str = ""
-    ):
+    ) -> str:
         """
         Generate a one-shot conversation prompt.
 
@@ -177,23 +350,24 @@ class PromptGenerator:
         """
         
         if system_prompt:
-            self.system_text = system_prompt.strip()
+            self.system_text = _maybe_strip(system_prompt)
         # else:
         #     if not self.system_text:
         #         raise ValueError("System prompt not set, please set it by passing it as a parameter or by using .set_system_prompt method.")
         if self.model_name == 'alpaca' and input:
-            prompt = (
-            self.system_prompt_helper.format(system=self.system_text.strip())
-            + self.input_prompt_helper.format(prompt=preprompt.strip() + user_prompt.strip(), input=input.strip())
-        )
+            prompt = self._fmt_one_shot_input(
+                system=self.system_text,
+                prompt=_maybe_strip(preprompt) + _maybe_strip(user_prompt),
+                input=_maybe_strip(input),
+            )
         else:
-            prompt = (
-                self.system_prompt_helper.format(system=self.system_text.strip())
-                + self.user_prompt_helper.format(prompt=preprompt.strip() + user_prompt.strip())
+            prompt = self._fmt_one_shot(
+                system=self.system_text,
+                prompt=_maybe_strip(preprompt) + _maybe_strip(user_prompt),
             )
         return prompt.strip()
 
-    def generate_prompt(self):
+    def generate_prompt(self) -> Union[str, List[dict]]:
         """
         Generate the conversation prompt based on the conversation history.
 
@@ -201,9 +375,18 @@ class PromptGenerator:
             str: The formatted conversation prompt.
         """
         if self.template_name == "openai":
-            return self.conversation
+            # Turns are stored as (role, content) tuples; build the
+            # list-of-dicts shape the API expects only when asked for.
+            if self._joined_cache is None:
+                self._joined_cache = [
+                    {"role": role, "content": content}
+                    for role, content in self.conversation
+                ]
+            return self._joined_cache
         else:
-            return "".join(self.conversation).strip()
+            if self._joined_cache is None:
+                self._joined_cache = "".join(self.conversation).strip()
+            return self._joined_cache
 
 
 # if __name__ == "__main__":